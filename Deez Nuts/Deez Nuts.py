@@ -5,14 +5,15 @@ import time
 import subprocess
 import threading
 import queue
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import itertools
 import re
-from urllib.parse import urlparse
 import random
 import logging
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 try:
     import spotipy
@@ -23,28 +24,94 @@ except ImportError:
 
 from deezer import API
 
+# orjson is optional; without it fall back to compact json.dumps output
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
+
 # Set up logging
 logging.basicConfig(filename='spotify_deezer_downloader.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-def is_valid_url(url, allowed_domains):
-    try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc]) and any(domain in result.netloc for domain in allowed_domains)
-    except ValueError:
-        return False
+_SPOTIFY_ARTIST_URL = re.compile(r'^https?://(?:open\.)?spotify\.com/(?:intl-[\w-]+/)?artist/(\w+)')
+_MAX_OUTPUT_LINES = 1000
+_UA_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+# Shared so every Spotify client reuses one cached access token
+_spotify_credentials = None
+
+def get_spotify_credentials():
+    global _spotify_credentials
+    if _spotify_credentials is None:
+        _spotify_credentials = SpotifyClientCredentials()
+    return _spotify_credentials
+
+def set_spotify_credentials(client_id, client_secret):
+    global _spotify_credentials
+    if os.environ.get('SPOTIPY_CLIENT_ID') == client_id and os.environ.get('SPOTIPY_CLIENT_SECRET') == client_secret:
+        return
+    os.environ['SPOTIPY_CLIENT_ID'] = client_id
+    os.environ['SPOTIPY_CLIENT_SECRET'] = client_secret
+    # The cached token belongs to the old credentials
+    _spotify_credentials = None
+
+def is_valid_url(url):
+    return bool(_SPOTIFY_ARTIST_URL.match(url))
+
+def make_session(pool_size):
+    session = requests.Session()
+    # Spotipy skips its own retrying session when given one, so mirror its policy
+    # here to keep backing off on rate limits and server errors
+    retry = Retry(total=3, status_forcelist=(429, 500, 502, 503, 504), backoff_factor=0.3,
+                  allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size * 2, max_retries=retry)
+    session.mount('https://', adapter)
+    return session
+
+def start_deemix(artist_dir, deezer_id):
+    # Run deemix directly instead of going through cmd.exe and a batch file. There
+    # is no console to answer a prompt, so stdin is closed to fail fast instead of
+    # hanging, and the output is captured so a failure can say what went wrong
+    return subprocess.Popen(['deemix', '-p', artist_dir, f'https://www.deezer.com/artist/{deezer_id}'],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, encoding='utf-8', errors='replace',
+                            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+
+def finish_deemix(process):
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(deemix_failure_message(process.returncode, stdout, stderr))
+
+def run_deemix(artist_dir, deezer_id):
+    finish_deemix(start_deemix(artist_dir, deezer_id))
+
+def deemix_failure_message(returncode, stdout, stderr):
+    # Without a saved .arl deemix asks for one with input(), which hits EOF on the closed stdin
+    if 'arl' in stdout.lower() and 'EOFError' in stderr:
+        return ("deemix is not logged in to Deezer. Run deemix once from a terminal and paste "
+                "your ARL when asked so it gets saved, then start the download again")
+    tail = ' | '.join(stderr.strip().splitlines()[-3:])
+    if tail:
+        return f"deemix exited with code {returncode}: {tail}"
+    return f"deemix exited with code {returncode}"
 
 class ArtistNode:
-    def __init__(self, spotify_id, name, depth=0):
+    def __init__(self, spotify_id, name, depth=0, genres=None):
         self.spotify_id = spotify_id
         self.name = name
+        self.genres = genres
         self.children = []
         self.depth = depth
         self.downloaded = False
         self.deezer_id = None
 
 class ArtistProcessor(threading.Thread):
-    def __init__(self, spotify_id, deezer_id, output_dir, album_types, max_retries, thread_id, node, output_callback, progress_callback, artist_finished_callback):
+    def __init__(self, spotify_id, deezer_id, output_dir, album_types, max_retries, thread_id, node, sp, dz, output_callback, progress_callback, artist_finished_callback):
         super().__init__()
         self.spotify_id = spotify_id
         self.deezer_id = deezer_id
@@ -53,8 +120,8 @@ class ArtistProcessor(threading.Thread):
         self.max_retries = max_retries
         self.thread_id = thread_id
         self.node = node
-        self.sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-        self.dz = API(requests.Session(), {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'})
+        self.sp = sp
+        self.dz = dz
         self.is_running = True
         self.output_callback = output_callback
         self.progress_callback = progress_callback
@@ -78,22 +145,7 @@ class ArtistProcessor(threading.Thread):
             artist_dir = os.path.join(self.output_dir, self.node.name)
             os.makedirs(artist_dir, exist_ok=True)
             
-            deemix_cmd = f'deemix -p "{artist_dir}" "https://www.deezer.com/artist/{deezer_artist["id"]}"'
-            
-            # Use a batch file to run deemix and close the CMD window when finished
-            batch_file_path = os.path.join(artist_dir, f"download_{deezer_artist['id']}.bat")
-            with open(batch_file_path, 'w') as batch_file:
-                batch_file.write(f"@echo off\n")
-                batch_file.write(f"{deemix_cmd}\n")
-                batch_file.write("echo Download completed!\n")
-                batch_file.write("exit\n")
-            
-            process = subprocess.Popen(f'start /wait cmd /c "{batch_file_path}"', shell=True)
-            
-            process.wait()
-            
-            # Remove the temporary batch file
-            os.remove(batch_file_path)
+            run_deemix(artist_dir, deezer_artist['id'])
             
             self.output_callback(f"Thread {self.thread_id}: Successfully downloaded artist: {deezer_artist['name']}")
             self.progress_callback(100, deezer_artist['name'])
@@ -108,7 +160,9 @@ class ArtistProcessor(threading.Thread):
 
 class SpotifyDeezerWildChainDownloader(threading.Thread):
     def __init__(self, spotify_link, output_dir, max_artists, album_types, max_retries, max_concurrent, wild_branching, wildly_different, max_depth, related_limit, output_callback, progress_callback, artist_finished_callback, tree_updated_callback, finished_callback):
-        super().__init__()
+        # Daemon like its workers so closing the window doesn't wait in queue.join();
+        # stop() terminates the deemix processes they leave behind
+        super().__init__(daemon=True)
         self.spotify_link = spotify_link
         self.output_dir = output_dir
         self.max_artists = max_artists
@@ -119,12 +173,15 @@ class SpotifyDeezerWildChainDownloader(threading.Thread):
         self.wildly_different = wildly_different
         self.max_depth = max_depth
         self.related_limit = related_limit
-        self.is_running = True
-        self.sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-        self.dz = API(requests.Session(), {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'})
-        self.processed_artists = set()
+        self.stop_event = threading.Event()
+        # One pooled session shared by both clients and all workers, so connections
+        # are reused instead of each worker doing its own TLS handshakes
+        self.session = make_session(max_concurrent)
+        self.sp = spotipy.Spotify(client_credentials_manager=get_spotify_credentials(), requests_session=self.session)
+        self.dz = API(self.session, _UA_HEADERS)
+        self.processed_artists = {}
+        self.claimed_slots = itertools.count()
         self.artist_queue = queue.Queue()
-        self.lock = threading.Lock()
         self.root_node = None
         self.current_depth = 0
         self.output_callback = output_callback
@@ -133,66 +190,97 @@ class SpotifyDeezerWildChainDownloader(threading.Thread):
         self.tree_updated_callback = tree_updated_callback
         self.finished_callback = finished_callback
         self.processed_genres = set()
-        self.batch_files = []
+        # Lookups are repeated when branches meet at the same artists, so keep the results
+        self._artist_cache = {}
+        self._deezer_cache = {}
+        self._cache_lock = threading.Lock()
+        # Running deemix processes, so stop() can terminate them
+        self.cancel_event = threading.Event()
+        self._processes = set()
+        self._process_lock = threading.Lock()
 
     def run(self):
-        if not is_valid_url(self.spotify_link, ['open.spotify.com']):
+        # Validate the link and pull out the artist ID in one match
+        match = _SPOTIFY_ARTIST_URL.match(self.spotify_link)
+        if not match:
             self.output_callback("Invalid Spotify URL. Please provide a valid Spotify artist link.")
             self.finished_callback()
             return
 
         try:
-            artist_id = re.search(r'artist/(\w+)', self.spotify_link).group(1)
-            spotify_artist = self.sp.artist(artist_id)
-            self.root_node = ArtistNode(artist_id, spotify_artist['name'])
+            artist_id = match.group(1)
+            spotify_artist = self._get_spotify_artist(artist_id)
+            self.root_node = ArtistNode(artist_id, spotify_artist['name'], genres=spotify_artist['genres'])
             self.tree_updated_callback(self.root_node)
             self.artist_queue.put(self.root_node)
 
-            with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
-                while not self.artist_queue.empty() and len(self.processed_artists) < self.max_artists and self.is_running:
-                    futures = []
-                    for _ in range(min(self.max_concurrent, self.artist_queue.qsize())):
-                        if not self.artist_queue.empty():
-                            node = self.artist_queue.get()
-                            futures.append(executor.submit(self.process_artist, node))
-                    
-                    for future in as_completed(futures):
-                        future.result()
+            # Keep max_concurrent workers pulling from the queue so one slow download
+            # doesn't leave the others idle until it finishes
+            workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.max_concurrent)]
+            for worker in workers:
+                worker.start()
+            self.artist_queue.join()
+            for _ in workers:
+                self.artist_queue.put(None)
+            for worker in workers:
+                worker.join()
 
             self.finished_callback()
         except Exception as e:
             self.output_callback(f"An error occurred: {str(e)}")
             logging.error(f"Error in main download process: {str(e)}")
             self.finished_callback()
-        finally:
-            self.cleanup_batch_files()
+
+    def worker(self):
+        while True:
+            node = self.artist_queue.get()
+            try:
+                if node is None:
+                    return
+                # Once stopped, keep draining the queue without processing
+                if not self.stop_event.is_set():
+                    self.process_artist(node)
+            finally:
+                self.artist_queue.task_done()
 
     def process_artist(self, node):
-        with self.lock:
-            if node.spotify_id in self.processed_artists or len(self.processed_artists) >= self.max_artists:
-                return
-            self.processed_artists.add(node.spotify_id)
+        # dict.setdefault and next() on a count are atomic, so workers can claim
+        # artists and download slots without taking a lock
+        if self.processed_artists.setdefault(node.spotify_id, node) is not node:
+            return
+        slot = next(self.claimed_slots)
+        if slot >= self.max_artists:
+            return
+        if slot == self.max_artists - 1:
+            # That was the last slot, so let the workers drain whatever is still queued
+            self.stop_event.set()
 
         try:
-            spotify_artist = self.sp.artist(node.spotify_id)
-            deezer_artist = self.find_deezer_artist(spotify_artist['name'])
+            # Nodes carry the name and genres from the response that created them,
+            # so only fetch the artist if they're missing
+            if node.genres is None:
+                node.genres = self._get_spotify_artist(node.spotify_id)['genres']
+            deezer_artist = self.find_deezer_artist(node.name)
             
             if deezer_artist:
                 node.deezer_id = deezer_artist['id']
-                success = self.download_artist(deezer_artist, node)
-                self.artist_finished_callback(f"{spotify_artist['name']}|{node.spotify_id}|{node.deezer_id}", success)
 
-                if len(self.processed_artists) < self.max_artists and node.depth < self.max_depth:
+                # Queue the related artists before downloading so other workers can
+                # start on them while deemix is busy with this one
+                if not self.stop_event.is_set() and node.depth < self.max_depth:
                     related_artists = self.sp.artist_related_artists(node.spotify_id)['artists']
                     if self.wild_branching:
                         random.shuffle(related_artists)
                     if self.wildly_different:
-                        related_artists = self.get_wildly_different_artists(spotify_artist, related_artists)
+                        related_artists = self.get_wildly_different_artists(node.genres, related_artists)
                     for related_artist in related_artists[:self.related_limit]:
-                        child_node = ArtistNode(related_artist['id'], related_artist['name'], node.depth + 1)
+                        child_node = ArtistNode(related_artist['id'], related_artist['name'], node.depth + 1, related_artist.get('genres'))
                         node.children.append(child_node)
                         self.artist_queue.put(child_node)
                     self.tree_updated_callback(self.root_node)
+
+                success = self.download_artist(deezer_artist, node)
+                self.artist_finished_callback(f"{node.name}|{node.spotify_id}|{node.deezer_id}", success)
             else:
                 self.output_callback(f"Could not find Deezer artist for: {node.name}")
         except Exception as e:
@@ -204,20 +292,21 @@ class SpotifyDeezerWildChainDownloader(threading.Thread):
             artist_dir = os.path.join(self.output_dir, node.name)
             os.makedirs(artist_dir, exist_ok=True)
             
-            deemix_cmd = f'deemix -p "{artist_dir}" "https://www.deezer.com/artist/{deezer_artist["id"]}"'
-            
-            batch_file_path = os.path.join(artist_dir, f"download_{deezer_artist['id']}.bat")
-            with open(batch_file_path, 'w') as batch_file:
-                batch_file.write(f"@echo off\n")
-                batch_file.write(f"{deemix_cmd}\n")
-                batch_file.write("echo Download completed!\n")
-                batch_file.write("exit\n")
-            
-            self.batch_files.append(batch_file_path)
-            
-            process = subprocess.Popen(f'start /wait cmd /c "{batch_file_path}"', shell=True)
-            
-            process.wait()
+            # Register under the lock so stop() can't miss a process that is just starting
+            with self._process_lock:
+                if self.cancel_event.is_set():
+                    raise RuntimeError("download was stopped")
+                process = start_deemix(artist_dir, deezer_artist['id'])
+                self._processes.add(process)
+            try:
+                finish_deemix(process)
+            except RuntimeError:
+                if self.cancel_event.is_set():
+                    raise RuntimeError("download was stopped") from None
+                raise
+            finally:
+                with self._process_lock:
+                    self._processes.discard(process)
             
             self.output_callback(f"Successfully downloaded artist: {deezer_artist['name']}")
             self.progress_callback(100, deezer_artist['name'])
@@ -227,62 +316,102 @@ class SpotifyDeezerWildChainDownloader(threading.Thread):
             logging.error(f"Error downloading artist {deezer_artist['name']}: {str(e)}")
             return False
 
-    def cleanup_batch_files(self):
-        for batch_file in self.batch_files:
-            try:
-                os.remove(batch_file)
-            except Exception as e:
-                logging.error(f"Error removing batch file {batch_file}: {str(e)}")
-
-    def get_wildly_different_artists(self, source_artist, related_artists):
-        source_genres = set(source_artist['genres'])
+    def get_wildly_different_artists(self, source_genres, related_artists):
         self.processed_genres.update(source_genres)
         
-        wildly_different = []
-        for artist in related_artists:
+        # The related-artists response already carries genres, so only look up
+        # (in one batched request) the artists that came back without them
+        missing_ids = [a['id'] for a in related_artists if 'genres' not in a]
+        fetched = {}
+        if missing_ids:
             try:
-                artist_full = self.sp.artist(artist['id'])
-                artist_genres = set(artist_full['genres'])
-                
-                # Check if the artist has any genres we haven't processed yet
-                new_genres = artist_genres - self.processed_genres
-                
-                if new_genres:
-                    wildly_different.append(artist)
-                    self.processed_genres.update(new_genres)
-                
-                if len(wildly_different) >= self.related_limit:
-                    break
+                fetched = dict(zip(missing_ids, self._get_spotify_artists(missing_ids)))
             except Exception as e:
-                self.output_callback(f"Error processing related artist {artist['name']}: {str(e)}")
-                logging.error(f"Error processing related artist {artist['name']}: {str(e)}")
+                self.output_callback(f"Error processing related artists: {str(e)}")
+                logging.error(f"Error processing related artists: {str(e)}")
+
+        genre_sets = []
+        for artist in related_artists:
+            artist_full = artist if 'genres' in artist else fetched.get(artist['id'])
+            genre_sets.append(frozenset(artist_full['genres']) if artist_full else None)
+
+        wildly_different = []
+        for artist, artist_genres in zip(related_artists, genre_sets):
+            if artist_genres is None:
+                continue
+
+            # Check if the artist has any genres we haven't processed yet
+            new_genres = artist_genres - self.processed_genres
+
+            if new_genres:
+                wildly_different.append(artist)
+                self.processed_genres.update(new_genres)
+
+            if len(wildly_different) >= self.related_limit:
+                break
         
         # If we don't have enough wildly different artists, add some random ones
         if len(wildly_different) < self.related_limit:
-            remaining = [a for a in related_artists if a not in wildly_different]
+            # Compare by identity; list membership would compare whole artist dicts
+            picked = set(id(a) for a in wildly_different)
+            remaining = [a for a in related_artists if id(a) not in picked]
             wildly_different.extend(random.sample(remaining, min(len(remaining), self.related_limit - len(wildly_different))))
         
         return wildly_different
 
+    def _get_spotify_artist(self, spotify_id):
+        with self._cache_lock:
+            if spotify_id in self._artist_cache:
+                return self._artist_cache[spotify_id]
+        artist = self.sp.artist(spotify_id)
+        with self._cache_lock:
+            self._artist_cache[spotify_id] = artist
+        return artist
+
+    def _get_spotify_artists(self, spotify_ids):
+        with self._cache_lock:
+            missing = [i for i in spotify_ids if i not in self._artist_cache]
+        # The several-artists endpoint accepts up to 50 IDs per request
+        for start in range(0, len(missing), 50):
+            artists = self.sp.artists(missing[start:start + 50])['artists']
+            with self._cache_lock:
+                for artist in artists:
+                    if artist:
+                        self._artist_cache[artist['id']] = artist
+        with self._cache_lock:
+            return [self._artist_cache.get(i) for i in spotify_ids]
+
     def find_deezer_artist(self, artist_name):
+        with self._cache_lock:
+            if artist_name in self._deezer_cache:
+                return self._deezer_cache[artist_name]
         try:
             result = self.dz.search_artist(artist_name, limit=1)
-            if result['data']:
-                return result['data'][0]
+            deezer_artist = result['data'][0] if result['data'] else None
+            # Errors fall through to the except below and are not cached
+            with self._cache_lock:
+                self._deezer_cache[artist_name] = deezer_artist
+            return deezer_artist
         except Exception as e:
             self.output_callback(f"Error finding Deezer artist: {str(e)}")
             logging.error(f"Error finding Deezer artist {artist_name}: {str(e)}")
         return None
 
     def stop(self):
-        self.is_running = False
-        self.cleanup_batch_files()
+        # cancel_event is separate from stop_event, which is also set once the last
+        # max_artists slot is taken while that artist still has to download
+        with self._process_lock:
+            self.cancel_event.set()
+            self.stop_event.set()
+            for process in self._processes:
+                process.terminate()
 
 class SpotifyDeemixGUI:
     def __init__(self, master):
         self.master = master
         self.master.title('Deez Nuts - Mass Downloader')
         self.master.geometry('1000x800')
+        self.master.protocol('WM_DELETE_WINDOW', self.on_close)
 
         self.notebook = ttk.Notebook(self.master)
         self.chain_tab = ttk.Frame(self.notebook)
@@ -305,8 +434,20 @@ class SpotifyDeemixGUI:
         self.load_settings()
 
         self.download_history = []
+        # add_to_history runs on the worker threads, and appends from separate
+        # handles aren't atomic on Windows
+        self._history_lock = threading.Lock()
         self.load_history()
 
+        self._tree_root = None
+        self._tree_dirty = False
+        self._tree_index = {}
+        self.master.after(200, self._flush_tree)
+
+        self._log_queue = queue.Queue()
+        self._ui_calls = queue.Queue()
+        self.master.after(100, self._drain_ui_queues)
+
     def setup_chain_tab(self):
         frame = ttk.Frame(self.chain_tab)
         frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -422,7 +563,7 @@ class SpotifyDeemixGUI:
 
     def load_settings(self):
         try:
-            with open('settings.json', 'r') as f:
+            with open('settings.json', 'r', encoding='utf-8') as f:
                 self.settings = json.load(f)
         except FileNotFoundError:
             self.settings = {}
@@ -432,8 +573,7 @@ class SpotifyDeemixGUI:
         self.output_dir_input.insert(0, self.settings.get('output_dir', ''))
         self.max_retries_input.set(self.settings.get('max_retries', 3))
 
-        os.environ['SPOTIPY_CLIENT_ID'] = self.client_id_input.get()
-        os.environ['SPOTIPY_CLIENT_SECRET'] = self.client_secret_input.get()
+        set_spotify_credentials(self.client_id_input.get(), self.client_secret_input.get())
 
     def save_settings(self):
         self.settings = {
@@ -442,11 +582,10 @@ class SpotifyDeemixGUI:
             'output_dir': self.output_dir_input.get(),
             'max_retries': int(self.max_retries_input.get()),
         }
-        with open('settings.json', 'w') as f:
-            json.dump(self.settings, f)
+        with open('settings.json', 'wb') as f:
+            f.write(_dumps(self.settings))
 
-        os.environ['SPOTIPY_CLIENT_ID'] = self.settings['client_id']
-        os.environ['SPOTIPY_CLIENT_SECRET'] = self.settings['client_secret']
+        set_spotify_credentials(self.settings['client_id'], self.settings['client_secret'])
 
         messagebox.showinfo("Settings Saved", "Your settings have been saved and applied.")
 
@@ -457,8 +596,8 @@ class SpotifyDeemixGUI:
             self.output_dir_input.insert(0, dir_path)
 
     def start_chain_download(self):
-        spotify_link = self.url_input.get()
-        if not is_valid_url(spotify_link, ['open.spotify.com']):
+        spotify_link = self.url_input.get().strip()
+        if not is_valid_url(spotify_link):
             messagebox.showerror("Invalid Input", "Please enter a valid Spotify artist link.")
             return
 
@@ -494,50 +633,135 @@ class SpotifyDeemixGUI:
         if hasattr(self, 'downloader'):
             self.downloader.stop()
         self.stop_button['state'] = tk.DISABLED
-        self.update_output("Stopping download after current artists finish...")
+        self.update_output("Stopping download and cancelling the artists in progress...")
+
+    def on_close(self):
+        # The download threads are daemons, so stop the deemix processes they started
+        # or those would keep downloading with no window after the app exits
+        if hasattr(self, 'downloader'):
+            self.downloader.stop()
+        self.master.destroy()
 
     def update_output(self, text):
-        self.output_display.insert(tk.END, text + '\n')
-        self.output_display.see(tk.END)
-        self.log_display.insert(tk.END, text + '\n')
-        self.log_display.see(tk.END)
+        # Called from the worker threads, so only queue the message and let
+        # _drain_ui_queues write it out on the Tk thread
+        self._log_queue.put_nowait(text)
+
+    def call_on_ui(self, func, *args):
+        # Tk may only be touched from its own thread; _drain_ui_queues runs the call there
+        self._ui_calls.put_nowait((func, args))
+
+    def _drain_ui_queues(self):
+        while True:
+            try:
+                func, args = self._ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+
+        batch = []
+        try:
+            while len(batch) < 500:
+                batch.append(self._log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if batch:
+            text = '\n'.join(batch) + '\n'
+            self.output_display.insert(tk.END, text)
+            # The full history stays in the Log tab, so keep the output pane short
+            lines = int(self.output_display.index('end-1c').split('.')[0])
+            if lines > _MAX_OUTPUT_LINES:
+                self.output_display.delete('1.0', f'{lines - _MAX_OUTPUT_LINES}.0')
+            self.output_display.see(tk.END)
+            self.log_display.insert(tk.END, text)
+            self.log_display.see(tk.END)
+        self.master.after(100, self._drain_ui_queues)
 
     def update_progress(self, value, artist_name):
+        self.call_on_ui(self._set_progress, value)
+
+    def _set_progress(self, value):
         self.progress_var.set(value)
         self.progress_bar['value'] = value
 
     def add_to_history(self, artist_name, success):
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        status = "Successfully downloaded" if success else "Failed to download"
-        history_item = f"{timestamp} - {status} {artist_name}"
+        entry = {
+            'ts': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'artist': artist_name,
+            'status': "Successfully downloaded" if success else "Failed to download",
+        }
+        self.append_history(entry)
+        self.call_on_ui(self._show_history_item, self.format_history_entry(entry))
+
+    def _show_history_item(self, history_item):
         self.download_history.append(history_item)
         self.history_list.insert(tk.END, history_item)
-        self.save_history()
 
-    def save_history(self):
-        with open('download_history.json', 'w') as f:
-            json.dump(self.download_history, f)
+    def format_history_entry(self, entry):
+        # Entries migrated from download_history.json are the already formatted strings
+        if isinstance(entry, str):
+            return entry
+        return f"{entry['ts']} - {entry['status']} {entry['artist']}"
+
+    def append_history(self, entry):
+        # One JSON object per line, so recording a download never rewrites the whole file
+        with self._history_lock:
+            with open('download_history.jsonl', 'ab') as f:
+                f.write(_dumps(entry) + b'\n')
 
     def load_history(self):
+        if not os.path.exists('download_history.jsonl'):
+            self.migrate_history()
+
+        self.download_history = []
+        try:
+            # Read bytes and let json.loads decode each line, so a truncated UTF-8
+            # sequence only spoils its own line
+            with open('download_history.jsonl', 'rb') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    # A truncated or garbled line shouldn't stop the app from starting
+                    try:
+                        self.download_history.append(self.format_history_entry(json.loads(line)))
+                    except (ValueError, KeyError, TypeError) as e:
+                        logging.warning(f"Skipping unreadable history line {line_number}: {str(e)}")
+        except FileNotFoundError:
+            pass
+        for item in self.download_history:
+            self.history_list.insert(tk.END, item)
+
+    def migrate_history(self):
         try:
             with open('download_history.json', 'r') as f:
-                self.download_history = json.load(f)
-            for item in self.download_history:
-                self.history_list.insert(tk.END, item)
+                old_history = json.load(f)
         except FileNotFoundError:
-            self.download_history = []
+            return
+        except ValueError as e:
+            # Leave the old file in place rather than failing to start
+            logging.warning(f"Could not migrate download_history.json: {str(e)}")
+            return
+        with open('download_history.jsonl', 'wb') as f:
+            f.write(b''.join(_dumps(item) + b'\n' for item in old_history))
+        os.remove('download_history.json')
 
     def clear_history(self):
         if messagebox.askyesno('Clear History', 'Are you sure you want to clear the download history?'):
             self.download_history.clear()
             self.history_list.delete(0, tk.END)
-            self.save_history()
+            with self._history_lock:
+                open('download_history.jsonl', 'w').close()
 
     def clear_log(self):
         if messagebox.askyesno('Clear Log', 'Are you sure you want to clear the log?'):
             self.log_display.delete('1.0', tk.END)
 
     def download_finished(self):
+        # Called from the downloader thread
+        self.call_on_ui(self._finish_download)
+
+    def _finish_download(self):
         self.start_button['state'] = tk.NORMAL
         self.stop_button['state'] = tk.DISABLED
         self.update_output("Chain download completed.")
@@ -545,27 +769,29 @@ class SpotifyDeemixGUI:
         messagebox.showinfo("Download Complete", "The chain download has finished.")
 
     def update_artist_tree(self, root_node):
-        self.artist_tree.delete(*self.artist_tree.get_children())
-        self._add_node(root_node, '')
+        # Called from the worker threads, so only mark the tree dirty here and let
+        # _flush_tree rebuild it on the Tk thread at most once per interval
+        self._tree_root = root_node
+        self._tree_dirty = True
+
+    def _flush_tree(self):
+        if self._tree_dirty:
+            self._tree_dirty = False
+            self.artist_tree.delete(*self.artist_tree.get_children())
+            self._tree_index.clear()
+            self._add_node(self._tree_root, '')
+        self.master.after(200, self._flush_tree)
 
     def _add_node(self, node, parent):
         tree_id = self.artist_tree.insert(parent, 'end', text=node.name, values=('Pending',))
+        self._tree_index[node.name] = tree_id
         for child in node.children:
             self._add_node(child, tree_id)
 
     def update_artist_status(self, artist_name, success):
-        for item in self.artist_tree.get_children():
-            if self._update_status(item, artist_name, success):
-                break
-
-    def _update_status(self, item, artist_name, success):
-        if self.artist_tree.item(item, 'text') == artist_name:
+        item = self._tree_index.get(artist_name)
+        if item:
             self.artist_tree.set(item, 'Status', 'Downloaded' if success else 'Failed')
-            return True
-        for child in self.artist_tree.get_children(item):
-            if self._update_status(child, artist_name, success):
-                return True
-        return False
 
 if __name__ == '__main__':
     root = tk.Tk()